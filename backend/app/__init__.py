@@ -1,5 +1,7 @@
 import os
-from flask import Flask, jsonify
+import orjson
+from flask import Flask, jsonify, g, request
+from flask.json.provider import DefaultJSONProvider
 from flask_sqlalchemy import SQLAlchemy
 from flask_migrate import Migrate
 from flask_jwt_extended import JWTManager
@@ -9,8 +11,38 @@ db = SQLAlchemy()
 migrate = Migrate()
 jwt = JWTManager()
 
+
+class OrjsonProvider(DefaultJSONProvider):
+    """Serializes response bodies with orjson; request bodies are parsed by the default provider.
+
+    Output matches Flask's default provider: sorted keys, non-string keys allowed, and
+    dates, Decimals and other extra types fall back to DefaultJSONProvider.default
+    (so dates stay HTTP dates). Anything orjson refuses, such as integers wider than
+    64 bits, is serialized by the default provider instead. Parsing stays with the
+    stdlib, which keeps wide integers exact where orjson would round them to floats.
+    """
+    option = orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+
+    def dumps(self, obj, **kwargs):
+        try:
+            return orjson.dumps(obj, default=DefaultJSONProvider.default, option=self.option).decode()
+        except orjson.JSONEncodeError:
+            return super().dumps(obj, **kwargs)
+
+    def response(self, *args, **kwargs):
+        # Same argument handling as jsonify(): one positional value, several (a list), or kwargs.
+        if args and kwargs:
+            raise TypeError("app.json.response() takes either args or kwargs, not both")
+        if len(args) == 1:
+            obj = args[0]
+        else:
+            obj = args or kwargs or None
+        return self._app.response_class(self.dumps(obj), mimetype="application/json")
+
+
 def create_app(config_class=Config):
     app = Flask(__name__)
+    app.json = OrjsonProvider(app)
     app.config.from_object(config_class)
 
     db.init_app(app)
@@ -26,6 +58,15 @@ def create_app(config_class=Config):
     # Import models to ensure they are known to Flask-Migrate
     from . import models
 
+    if app.config.get('TESTING'):
+        # Test-only shortcut: a request carrying X-Test-User-Id is treated as authenticated
+        # as that user, and token_required_custom skips JWT and session checks for it.
+        # Assigned on every request (None when absent): g outlives the request whenever
+        # an app context is already pushed, as in the test suite.
+        @app.before_request
+        def load_test_user_id():
+            g.current_user_id = request.headers.get('X-Test-User-Id')
+
     # Custom CLI command to create initial user
     @app.cli.command("create-initial-user")
     def create_initial_user_command():
@@ -1,9 +1,17 @@
+import logging
 import uuid
-from datetime import datetime, timedelta
-from sqlalchemy.dialects.postgresql import UUID, JSONB
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import event, inspect
+from sqlalchemy.dialects.postgresql import UUID, JSONB, insert as pg_insert
 from werkzeug.security import generate_password_hash, check_password_hash
 from . import db
 
+logger = logging.getLogger(__name__)
+
+def _utcnow():
+    """Timezone-aware current time, the default for created_at columns."""
+    return datetime.now(timezone.utc)
+
 class User(db.Model):
     __tablename__ = 'users'
     id = db.Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
@@ -27,7 +35,7 @@ class Session(db.Model):
     id = db.Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     user_id = db.Column(UUID(as_uuid=True), db.ForeignKey('users.id'), nullable=False)
     token = db.Column(db.Text, nullable=False, unique=True) # JWT tokens can be long
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    created_at = db.Column(db.DateTime(timezone=True), default=_utcnow)
     expires_at = db.Column(db.DateTime, nullable=False)
 
     def __init__(self, **kwargs):
@@ -49,7 +57,7 @@ class BigQueryConfig(db.Model):
     user_id = db.Column(UUID(as_uuid=True), db.ForeignKey('users.id'), nullable=False)
     gcp_key_json = db.Column(db.JSON, nullable=False) # Use JSON for broader compatibility (inc. SQLite)
     connection_name = db.Column(db.String(100), nullable=False)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    created_at = db.Column(db.DateTime(timezone=True), default=_utcnow)
 
     __table_args__ = (db.UniqueConstraint('user_id', 'connection_name', name='uq_user_connection_name'),)
 
@@ -57,6 +65,29 @@ class BigQueryConfig(db.Model):
     def __repr__(self):
         return f'<BigQueryConfig {self.connection_name} for User {self.user_id}>'
 
+@event.listens_for(BigQueryConfig, 'after_delete')
+def _invalidate_bigquery_caches(mapper, connection, target):
+    """Drops the cached BigQuery client and schemas for a changed or deleted config's key,
+    and for the key it replaced, so rotated credentials are never served from cache.
+
+    Runs inside the flush, so a failure is logged rather than allowed to fail the write.
+    """
+    try:
+        from .services.bigquery_service import BigQueryService
+        BigQueryService.invalidate_for_config(target)
+        for previous_key in inspect(target).attrs.gcp_key_json.history.deleted or ():
+            if previous_key:
+                BigQueryService.invalidate(previous_key)
+    except Exception:
+        logger.exception("Failed to invalidate BigQuery caches for config %s", target.id)
+
+
+@event.listens_for(BigQueryConfig, 'after_update')
+def _invalidate_bigquery_caches_on_key_change(mapper, connection, target):
+    """Only a new gcp_key_json makes the cached client stale; other edits, such as a rename, keep it."""
+    if inspect(target).attrs.gcp_key_json.history.has_changes():
+        _invalidate_bigquery_caches(mapper, connection, target)
+
 
 class Object(db.Model):
     __tablename__ = 'objects'
@@ -65,7 +96,7 @@ class Object(db.Model):
     connection_id = db.Column(UUID(as_uuid=True), db.ForeignKey('bigquery_configs.id'), nullable=False)
     object_name = db.Column(db.String(255), nullable=False) # e.g., dataset_name.table_name or dataset_name.view_name
     object_description = db.Column(db.Text, nullable=True)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    created_at = db.Column(db.DateTime(timezone=True), default=_utcnow)
 
     # Relationships
     fields = db.relationship('Field', backref='object', lazy=True, cascade="all, delete-orphan")
@@ -86,10 +117,29 @@ class Field(db.Model):
     object_id = db.Column(UUID(as_uuid=True), db.ForeignKey('objects.id'), nullable=False)
     field_name = db.Column(db.String(255), nullable=False)
     field_description = db.Column(db.Text, nullable=True)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    created_at = db.Column(db.DateTime(timezone=True), default=_utcnow)
 
     # No explicit backref needed here for object, as it's already defined in Object model.
 
+    @classmethod
+    def bulk_upsert(cls, session, rows):
+        """Inserts many fields in one executemany INSERT, bypassing the unit of work.
+
+        Each row is a dict of column values. Rows carrying the id of an existing field
+        update its name and description; rows without an id get a new one.
+        """
+        if not rows:
+            return
+        stmt = pg_insert(cls)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[cls.id],
+            set_={
+                "field_name": stmt.excluded.field_name,
+                "field_description": stmt.excluded.field_description,
+            },
+        )
+        session.execute(stmt, rows)
+
     def __repr__(self):
         return f'<Field {self.field_name} for Object {self.object_id}>'
 
@@ -1,6 +1,6 @@
 import json
 import uuid # Added for UUID conversion
-from flask import request, jsonify, current_app
+from flask import request, jsonify, current_app, g
 from flask_jwt_extended import get_jwt_identity, jwt_required
 from sqlalchemy.exc import SQLAlchemyError
 from . import api_bp
@@ -12,7 +12,8 @@ from ..services.gemini_service import GeminiService # Import GeminiService
 
 # Helper to get current user from JWT (after token_required_custom has run)
 def get_current_user_from_jwt():
-    user_id_str = get_jwt_identity()
+    # g.current_user_id is only ever set by the TESTING-mode X-Test-User-Id hook.
+    user_id_str = g.get('current_user_id') or get_jwt_identity()
     if not user_id_str:
         return None # Or raise an error, depending on expected behavior
     try:
@@ -24,6 +25,14 @@ def get_current_user_from_jwt():
     return db.session.get(User, user_id_uuid)
 
 
+def parse_connection_id(connection_id):
+    """The request's connection_id as a UUID (the id column holds UUID objects), or None if malformed."""
+    try:
+        return uuid.UUID(str(connection_id))
+    except ValueError:
+        return None
+
+
 @api_bp.route('/data', methods=['GET'])
 @token_required_custom
 def get_data():
@@ -139,7 +148,7 @@ def test_config():
 
     try:
         # The gcp_key_json is stored as a dict/JSONB, pass it directly
-        bq_service = BigQueryService(config.gcp_key_json)
+        bq_service = BigQueryService.get_or_create(config.gcp_key_json)
         success, message = bq_service.test_connection()
         if success:
             return jsonify(message=message), 200
@@ -239,6 +248,9 @@ def get_table_schema_endpoint():
     # Basic validation for object_name format
     if '.' not in object_name or len(object_name.split('.')) != 2:
         return jsonify(message="Invalid object_name format. Expected 'dataset_id.table_id'."), 400
+    connection_id = parse_connection_id(connection_id)
+    if connection_id is None:
+        return jsonify(message="connection_id must be a valid UUID."), 400
 
     # Fetch BigQueryConfig
     config = BigQueryConfig.query.filter_by(id=connection_id, user_id=current_user.id).first()
@@ -246,7 +258,7 @@ def get_table_schema_endpoint():
         return jsonify(message="BigQuery configuration not found or access denied."), 404
 
     try:
-        bq_service = BigQueryService(config.gcp_key_json)
+        bq_service = BigQueryService.get_or_create(config.gcp_key_json)
         success, result = bq_service.get_table_schema(object_name)
 
         if success:
@@ -288,6 +300,9 @@ def update_table_schema_description():
 
     if fields_data is not None and not isinstance(fields_data, list):
         return jsonify(message="fields must be a list of objects."), 400
+    connection_id = parse_connection_id(connection_id)
+    if connection_id is None:
+        return jsonify(message="connection_id must be a valid UUID."), 400
 
     # Fetch BigQueryConfig to ensure connection_id is valid for the user
     config = BigQueryConfig.query.filter_by(id=connection_id, user_id=current_user.id).first()
@@ -334,7 +349,7 @@ def update_table_schema_description():
 
                 if not db_field:
                     new_field = Field(
-                        object_id=db_object.id,
+                        object=db_object, # Keeps an already-loaded db_object.fields in step
                         field_name=field_name,
                         field_description=field_description
                     )
@@ -360,23 +375,32 @@ def update_table_schema_description():
 def get_objects_with_fields():
     current_user = get_current_user_from_jwt()
     try:
-        user_objects = Object.query.filter_by(user_id=current_user.id).all()
-        result = []
-        for obj in user_objects:
-            fields_list = []
-            for field in obj.fields: # Accessing the related Field objects
-                fields_list.append({
+        # Column-only queries: rows are plain tuples rather than ORM instances with
+        # identity-map state, and all fields are loaded in one query instead of one per object.
+        user_objects = db.session.query(
+            Object.id, Object.connection_id, Object.object_name, Object.object_description
+        ).filter(Object.user_id == current_user.id).all()
+
+        fields_by_object_id = {}
+        if user_objects:
+            field_rows = db.session.query(
+                Field.object_id, Field.id, Field.field_name, Field.field_description
+            ).join(Object, Field.object_id == Object.id).filter(Object.user_id == current_user.id)
+            for field in field_rows:
+                fields_by_object_id.setdefault(field.object_id, []).append({
                     "id": str(field.id),
                     "field_name": field.field_name,
                     "field_description": field.field_description if field.field_description is not None else ""
                 })
 
+        result = []
+        for obj in user_objects:
             result.append({
                 "id": str(obj.id),
                 "connection_id": str(obj.connection_id),
                 "object_name": obj.object_name,
                 "object_description": obj.object_description if obj.object_description is not None else "",
-                "fields": fields_list
+                "fields": fields_by_object_id.get(obj.id, [])
             })
         return jsonify(result), 200
     except SQLAlchemyError as e:
@@ -404,6 +428,9 @@ def generate_sql_from_natural_language():
         return jsonify(message="user_request is required."), 400
     if not connection_id:
         return jsonify(message="connection_id is required."), 400
+    connection_id = parse_connection_id(connection_id)
+    if connection_id is None:
+        return jsonify(message="connection_id must be a valid UUID."), 400
 
     # Validate object_names if provided
     if object_names is not None: # Allows object_names to be explicitly null or an empty list
@@ -531,7 +558,7 @@ def dry_run_query():
         return jsonify(message="Configuration not found or access denied."), 404
 
     try:
-        bq_service = BigQueryService(config.gcp_key_json)
+        bq_service = BigQueryService.get_or_create(config.gcp_key_json)
         success, result = bq_service.dry_run_query(sql_query)
         if success:
             # result already contains the message and data
@@ -592,7 +619,7 @@ def execute_bq_query():
         return jsonify(message="Configuration not found or access denied."), 404
 
     try:
-        bq_service = BigQueryService(config.gcp_key_json)
+        bq_service = BigQueryService.get_or_create(config.gcp_key_json)
         success, result = bq_service.execute_query(sql_query)
         if success:
             # result contains message and data
@@ -1,20 +1,130 @@
+import hashlib
 import json
+import re
+import threading
+import orjson
+import xxhash
+from cachetools import TTLCache
+from google.auth.transport.requests import AuthorizedSession
 from google.oauth2 import service_account
 from google.cloud import bigquery
+from google.cloud.bigquery.retry import DEFAULT_RETRY
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from google.api_core.exceptions import GoogleAPICallError
 
+# Table schemas keyed by (key fingerprint, table_id), shared by every BigQueryService
+# built from the same key, so one service account never sees another's cached schemas.
+# Each entry is a _SchemaEntry, whose JSON bytes are serialized on first request and then reused.
+# Only successful lookups are cached; entries expire after SCHEMA_CACHE_TTL_SECONDS.
+SCHEMA_CACHE_TTL_SECONDS = 300
+_schema_cache = TTLCache(maxsize=1024, ttl=SCHEMA_CACHE_TTL_SECONDS)
+_schema_cache_lock = threading.RLock()
+
+# Services keyed by the sha256 of their key JSON, so credentials are parsed and a
+# bigquery.Client (with its HTTP connection pool) is built once per key, not per request.
+_INSTANCES = TTLCache(maxsize=64, ttl=3600)
+_instances_lock = threading.Lock()
+
+# Dataset IDs may only contain letters, digits and underscores.
+_DATASET_ID_RE = re.compile(r"[A-Za-z0-9_]+")
+
+# tables.list returns at most 50 tables per page by default; ask for the API maximum so a
+# large dataset is enumerated in a few requests. Paging through it may take a while.
+LIST_TABLES_PAGE_SIZE = 1000
+_LIST_TABLES_RETRY = DEFAULT_RETRY.with_deadline(300)
+
+class _SchemaEntry:
+    """A cached table schema, plus its JSON bytes once get_table_schema_bytes has asked for them."""
+    __slots__ = ("fields", "json_bytes")
+
+    def __init__(self, fields):
+        self.fields = fields
+        self.json_bytes = None
+
+def _key_json_bytes(gcp_key_json):
+    """The key as JSON bytes: a str as given, a dict serialized with sorted keys.
+
+    Uses the stdlib encoder, which handles anything json could have parsed (orjson
+    rejects integers wider than 64 bits). Raises ValueError if the key can't be serialized.
+    """
+    if isinstance(gcp_key_json, str):
+        return gcp_key_json.encode('utf-8')
+    try:
+        return json.dumps(gcp_key_json, sort_keys=True).encode('utf-8')
+    except (TypeError, ValueError) as e:
+        raise ValueError(f"Invalid GCP JSON key format: {e}")
+
+def _build_http_session(credentials):
+    """An authorized HTTP session with a larger connection pool than the requests default (10),
+    so a shared client doesn't churn TLS connections under concurrent requests. urllib3 retries
+    connect errors for every method, POST included, since the request was never sent, but read
+    errors only for idempotent methods, so a query job is never replayed once sent."""
+    session = AuthorizedSession(credentials, refresh_timeout=300)
+    session.mount("https://", HTTPAdapter(
+        pool_connections=32,
+        pool_maxsize=32,
+        max_retries=Retry(total=3, backoff_factor=0.2),
+    ))
+    return session
+
 class BigQueryService:
     def __init__(self, gcp_key_json_str):
         try:
-            key_data = json.loads(gcp_key_json_str) if isinstance(gcp_key_json_str, str) else gcp_key_json_str
+            key_data = orjson.loads(gcp_key_json_str) if isinstance(gcp_key_json_str, str) else gcp_key_json_str
+            # Cheap non-cryptographic identity of the key, used to scope the schema cache.
+            self._key_fingerprint = xxhash.xxh3_64_intdigest(_key_json_bytes(gcp_key_json_str))
             self.credentials = service_account.Credentials.from_service_account_info(key_data)
             self.project_id = self.credentials.project_id
-            self.client = bigquery.Client(credentials=self.credentials, project=self.project_id)
-        except json.JSONDecodeError as e:
+            self.client = bigquery.Client(
+                credentials=self.credentials,
+                project=self.project_id,
+                _http=_build_http_session(self.credentials),
+            )
+        except orjson.JSONDecodeError as e:
             raise ValueError(f"Invalid GCP JSON key format: {e}")
         except Exception as e:
             raise ValueError(f"Error initializing BigQuery client from key: {e}")
 
+    @classmethod
+    def get_or_create(cls, gcp_key_json_str):
+        """
+        Returns a shared BigQueryService for the given key, creating it on first use.
+
+        Accepts the same str or dict as the constructor (dicts are keyed by their
+        sorted-key JSON), and raises the same ValueError for an unusable key; failed
+        constructions are not cached.
+        """
+        # sha256 rather than the xxh3 fingerprint: a collision here would hand out
+        # another key's client.
+        instance_key = hashlib.sha256(_key_json_bytes(gcp_key_json_str)).hexdigest()
+        with _instances_lock:
+            service = _INSTANCES.get(instance_key)
+            if service is None:
+                service = cls(gcp_key_json_str)
+                _INSTANCES[instance_key] = service
+        return service
+
+    @classmethod
+    def invalidate(cls, gcp_key_json_str):
+        """
+        Drops the shared service and every cached table schema for the given key,
+        so the next request for it builds a fresh client and refetches schemas.
+        """
+        key_bytes = _key_json_bytes(gcp_key_json_str)
+        fingerprint = xxhash.xxh3_64_intdigest(key_bytes)
+        with _instances_lock:
+            _INSTANCES.pop(hashlib.sha256(key_bytes).hexdigest(), None)
+        with _schema_cache_lock:
+            for cache_key in [cache_key for cache_key in _schema_cache if cache_key[0] == fingerprint]:
+                _schema_cache.pop(cache_key, None)
+
+    @classmethod
+    def invalidate_for_config(cls, config):
+        """Invalidates the key held by a BigQueryConfig (anything with a gcp_key_json)."""
+        if config.gcp_key_json:
+            cls.invalidate(config.gcp_key_json)
+
     def test_connection(self):
         try:
             # A simple way to test connection is to list datasets (limited to 1)
@@ -67,18 +177,139 @@ class BigQueryService:
                    If successful, data_or_error_message is a list of dicts,
                    where each dict represents a field with 'name' and 'field_type'.
                    If an error occurs, data_or_error_message is a dict with a 'message' key.
+                   Successful results are served from a TTL cache for repeated calls.
         """
-        try:
-            table = self.client.get_table(table_id)  # API request
-            schema_info = []
-            for field in table.schema:
-                schema_info.append({"name": field.name, "field_type": field.field_type})
+        success, entry = self._get_cached_schema(table_id)
+        if not success:
+            return success, entry
+        # Copies, so callers can't modify the cached entry.
+        return True, [dict(field) for field in entry.fields]
+
+    def get_table_schema_bytes(self, table_id: str):
+        """
+        Like get_table_schema, but returns the schema list as JSON bytes.
+
+        The bytes are serialized on the first call for a cached schema and kept with it,
+        so repeated calls can be sent as a response body as-is.
 
-            return True, schema_info
+        Returns:
+            tuple: (success, bytes_or_error_message)
+                   If an error occurs, bytes_or_error_message is a dict with a 'message' key.
+        """
+        success, entry = self._get_cached_schema(table_id)
+        if not success:
+            return success, entry
+        if entry.json_bytes is None:
+            # Racing callers at worst serialize twice and store identical bytes.
+            entry.json_bytes = orjson.dumps(entry.fields)
+        return True, entry.json_bytes
+
+    def _get_cached_schema(self, table_id: str):
+        cache_key = (self._key_fingerprint, table_id)
+        with _schema_cache_lock:
+            entry = _schema_cache.get(cache_key)
+        if entry is None:
+            success, result = self._get_table_schema_uncached(table_id)
+            if not success:
+                return success, result
+            entry = _SchemaEntry(result)
+            with _schema_cache_lock:
+                _schema_cache[cache_key] = entry
+        return True, entry
+
+    def iter_table_schema(self, table_id: str):
+        """
+        Yields one {'name', 'field_type'} dict per column of the table.
+
+        Nothing is requested until iteration starts, and API errors propagate to the
+        caller. Unlike get_table_schema, results are not cached.
+        """
+        table = self.client.get_table(table_id)  # API request
+        for field in table.schema:
+            yield {"name": field.name, "field_type": field.field_type}
+
+    def _get_table_schema_uncached(self, table_id: str):
+        try:
+            return True, list(self.iter_table_schema(table_id))
         except GoogleAPICallError as e:
             # More specific error messages can be helpful
             if e.code == 404: # Not Found
                  return False, {"message": f"Table or view '{table_id}' not found in project '{self.project_id}'. Error: {e}"}
             return False, {"message": f"Failed to get schema for table '{table_id}'. BigQuery API error: {e}"}
         except Exception as e:
-            return False, {"message": f"An unexpected error occurred while fetching schema for table '{table_id}': {e}"}
\ No newline at end of file
+            return False, {"message": f"An unexpected error occurred while fetching schema for table '{table_id}': {e}"}
+
+    def get_schemas_bulk(self, table_ids):
+        """
+        Retrieves the schemas of many tables with one INFORMATION_SCHEMA query per dataset,
+        instead of one tables.get request per table.
+
+        Args:
+            table_ids (list[str]): Table IDs in the format 'dataset_id.table_id'.
+
+        Returns:
+            tuple: (success, data_or_error_message)
+                   If successful, data_or_error_message maps each table ID that exists to a
+                   list of {'name', 'field_type'} dicts in column order. Note that 'field_type'
+                   is INFORMATION_SCHEMA's SQL type (e.g. 'INT64'), not the legacy name
+                   (e.g. 'INTEGER') returned by get_table_schema.
+                   If an error occurs, data_or_error_message is a dict with a 'message' key.
+        """
+        tables_by_dataset = {}
+        for table_id in table_ids:
+            # The dataset ID is interpolated into the SQL, so only plain identifiers are allowed.
+            # Table names are bound as a query parameter and need no check.
+            dataset_id, _, table_name = table_id.partition('.')
+            if not table_name or not _DATASET_ID_RE.fullmatch(dataset_id):
+                return False, {"message": f"Invalid table ID '{table_id}'. Expected 'dataset_id.table_id', "
+                                          "where dataset_id contains only letters, digits and underscores."}
+            tables_by_dataset.setdefault(dataset_id, []).append(table_name)
+
+        schemas = {}
+        try:
+            for dataset_id, table_names in tables_by_dataset.items():
+                query = (
+                    "SELECT table_name, column_name, data_type "
+                    f"FROM `{self.project_id}.{dataset_id}.INFORMATION_SCHEMA.COLUMNS` "
+                    "WHERE table_name IN UNNEST(@names) "
+                    "ORDER BY table_name, ordinal_position"
+                )
+                job_config = bigquery.QueryJobConfig(
+                    query_parameters=[bigquery.ArrayQueryParameter("names", "STRING", table_names)]
+                )
+                for row in self.client.query(query, job_config=job_config).result():
+                    schemas.setdefault(f"{dataset_id}.{row['table_name']}", []).append(
+                        {"name": row['column_name'], "field_type": row['data_type']}
+                    )
+            return True, schemas
+        except GoogleAPICallError as e:
+            return False, {"message": f"Failed to get schemas from INFORMATION_SCHEMA. BigQuery API error: {e}"}
+        except Exception as e:
+            return False, {"message": f"An unexpected error occurred while fetching schemas: {e}"}
+
+    def list_tables_fast(self, dataset_id: str, max_results=None):
+        """
+        Lists the tables and views in a dataset, LIST_TABLES_PAGE_SIZE per request.
+
+        Args:
+            dataset_id (str): The dataset ID; the project is taken from the client's project.
+            max_results (int, optional): Stop after this many tables.
+
+        Returns:
+            tuple: (success, data_or_error_message)
+                   If successful, data_or_error_message is a list of
+                   (project, dataset_id, table_id) tuples.
+                   If an error occurs, data_or_error_message is a dict with a 'message' key.
+        """
+        try:
+            tables = self.client.list_tables(
+                dataset_id,
+                max_results=max_results,
+                page_size=LIST_TABLES_PAGE_SIZE,
+                retry=_LIST_TABLES_RETRY,
+            )
+            return True, [(table.project, table.dataset_id, table.table_id) for table in tables]
+        except GoogleAPICallError as e:
+            return False, {"message": f"Failed to list tables in dataset '{dataset_id}'. BigQuery API error: {e}"}
+        except Exception as e:
+            return False, {"message": f"An unexpected error occurred while listing tables in dataset '{dataset_id}': {e}"}
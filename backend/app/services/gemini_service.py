@@ -1,6 +1,10 @@
 import google.generativeai as genai
 from google.generativeai.types import HarmCategory, HarmBlockThreshold
 import logging
+import re
+import threading
+from functools import lru_cache
+from cachetools import LRUCache
 from flask import current_app # For logger and app context for DB
 
 # Assuming models.py and __init__.py (for db) are structured correctly relative to services
@@ -12,6 +16,73 @@ from ..models import GeminiAPIKey
 
 logger = logging.getLogger(__name__)
 
+# Markdown code fences around a generated query: an opening ``` or ```sql, and a closing ```.
+_FENCE_RE = re.compile(r"^\s*```(?:sql)?\s*\n?|\n?```\s*$", re.IGNORECASE)
+
+# Successful generations keyed by _cache_key(). Module-level because a GeminiService
+# is created per request; an identical request and schema context skips the model call.
+_sql_cache = LRUCache(maxsize=10_000)
+_sql_cache_lock = threading.Lock()
+
+
+def _cache_key(user_request, objects_with_fields):
+    """Order-insensitive key for a request and its table/field context."""
+    return (user_request, _schema_key(objects_with_fields))
+
+def _schema_key(objects_with_fields):
+    """Hashable, order-insensitive form of the table/field context, holding only what the prompt uses.
+
+    Missing names and descriptions are normalized to strings and everything is sorted by
+    repr, so any mix of values has a total order.
+    """
+    return tuple(sorted(
+        (
+            (
+                obj.get('object_name', 'N/A'),
+                obj.get('object_description') or '',
+                tuple(sorted(
+                    ((field.get('field_name', 'N/A'), field.get('field_description') or '')
+                     for field in obj.get('fields') or []),
+                    key=repr,
+                )),
+            )
+            for obj in objects_with_fields
+        ),
+        key=repr,
+    ))
+
+
+@lru_cache(maxsize=256)
+def _schema_fragment(schema_key):
+    """The instructions and table descriptions that open every prompt, built once per schema context."""
+    prompt_parts = [
+        "Based on the following table structures and user request, generate a BigQuery SQL query.",
+        "Return ONLY the SQL query and nothing else. Do not include any introductory text, explanations, or markdown formatting like ```sql ... ```.",
+        "Ensure the query is valid BigQuery SQL syntax."
+    ]
+
+    for object_name, object_description, fields in schema_key:
+        table_prompt = f"\nTable `{object_name}`"
+        if object_description:
+            table_prompt += f" (Description: {object_description}):"
+        else:
+            table_prompt += ":"
+
+        fields_prompt_parts = []
+        for field_name, field_description in fields:
+            field_str = f"- `{field_name}`"
+            if field_description:
+                field_str += f" (Description: {field_description})"
+            fields_prompt_parts.append(field_str)
+
+        if fields_prompt_parts:
+            table_prompt += "\n" + "\n".join(fields_prompt_parts)
+        else:
+            table_prompt += "\n- (No field information available for this table)"
+        prompt_parts.append(table_prompt)
+
+    return "\n".join(prompt_parts)
+
 class GeminiService:
     def __init__(self):
         # Fetch API key from database
@@ -59,38 +130,19 @@ class GeminiService:
                   'full_prompt' (str, the prompt sent to Gemini), or None if
                   critical input like user_request or objects_with_fields is missing.
         """
-        if not user_request:
-            return None # Or raise ValueError("User request cannot be empty.")
-        if not objects_with_fields:
-            return None # Or raise ValueError("Table/view information must be provided.")
-
-        prompt_parts = [
-            "Based on the following table structures and user request, generate a BigQuery SQL query.",
-            "Return ONLY the SQL query and nothing else. Do not include any introductory text, explanations, or markdown formatting like ```sql ... ```.",
-            "Ensure the query is valid BigQuery SQL syntax."
-        ]
-
-        for obj_info in objects_with_fields:
-            table_prompt = f"\nTable `{obj_info.get('object_name', 'N/A')}`"
-            if obj_info.get('object_description'):
-                table_prompt += f" (Description: {obj_info['object_description']}):"
-            else:
-                table_prompt += ":"
-
-            fields_prompt_parts = []
-            if obj_info.get('fields'):
-                for field in obj_info['fields']:
-                    field_str = f"- `{field.get('field_name', 'N/A')}`"
-                    if field.get('field_description'):
-                        field_str += f" (Description: {field['field_description']})"
-                    fields_prompt_parts.append(field_str)
-
-            if fields_prompt_parts:
-                table_prompt += "\n" + "\n".join(fields_prompt_parts)
-            else:
-                table_prompt += "\n- (No field information available for this table)"
-            prompt_parts.append(table_prompt)
-
+        # Nothing to generate from: bail out before hashing or building the prompt.
+        if not user_request or not objects_with_fields:
+            return None
+
+        cache_key = _cache_key(user_request, objects_with_fields)
+        with _sql_cache_lock:
+            cached = _sql_cache.get(cache_key)
+        if cached is not None:
+            logger.debug("Returning cached SQL for an identical request.")
+            return dict(cached)
+
+        _, schema_key = cache_key
+        prompt_parts = [_schema_fragment(schema_key)]
         prompt_parts.append(f"\nUser request: \"{user_request}\"")
         prompt_parts.append("\nGenerated BigQuery SQL Query:")
 
@@ -124,16 +176,15 @@ class GeminiService:
 
             if response.candidates:
                 generated_sql = response.candidates[0].content.parts[0].text.strip()
-                # Clean up potential markdown
-                if generated_sql.lower().startswith("```sql"):
-                    generated_sql = generated_sql[5:]
-                if generated_sql.lower().startswith("```"): # Catch if only ``` is used
-                    generated_sql = generated_sql[3:]
-                if generated_sql.endswith("```"):
-                    generated_sql = generated_sql[:-3]
+                # Clean up potential markdown; most responses have no fence and skip the regex.
+                if generated_sql.startswith("```") or generated_sql.endswith("```"):
+                    generated_sql = _FENCE_RE.sub("", generated_sql)
 
                 logger.info(f"Successfully generated SQL query: {generated_sql}")
-                return {'sql': generated_sql.strip(), 'full_prompt': final_prompt}
+                result = {'sql': generated_sql.strip(), 'full_prompt': final_prompt}
+                with _sql_cache_lock:
+                    _sql_cache[cache_key] = result
+                return dict(result)
             else:
                 # Handle cases where response might be blocked or has no candidates
                 # This can happen if safety settings block the response despite BLOCK_NONE (unlikely for SQL)
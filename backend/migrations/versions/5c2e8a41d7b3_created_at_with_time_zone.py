@@ -0,0 +1,35 @@
+"""created_at_with_time_zone
+
+Revision ID: 5c2e8a41d7b3
+Revises: 0f76863d66f1
+Create Date: 2026-10-15 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5c2e8a41d7b3'
+down_revision = '0f76863d66f1'
+branch_labels = None
+depends_on = None
+
+TABLES = ('sessions', 'bigquery_configs', 'objects', 'fields')
+
+
+def upgrade():
+    # Existing values were written with datetime.utcnow(), so they are read as UTC.
+    for table in TABLES:
+        op.alter_column(table, 'created_at',
+                        existing_type=sa.DateTime(),
+                        type_=sa.DateTime(timezone=True),
+                        postgresql_using="created_at AT TIME ZONE 'UTC'")
+
+
+def downgrade():
+    for table in TABLES:
+        op.alter_column(table, 'created_at',
+                        existing_type=sa.DateTime(timezone=True),
+                        type_=sa.DateTime(),
+                        postgresql_using="created_at AT TIME ZONE 'UTC'")
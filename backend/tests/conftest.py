@@ -0,0 +1,20 @@
+import pytest
+from sqlalchemy import event
+
+
+def _enable_sqlite_savepoints(engine):
+    # pysqlite defers BEGIN and would turn our SAVEPOINTs into real commits.
+    # Let SQLAlchemy emit BEGIN itself so the per-test transaction can be rolled back.
+    @event.listens_for(engine, "connect")
+    def _configure_sqlite_connection(dbapi_connection, connection_record):
+        dbapi_connection.isolation_level = None
+
+    @event.listens_for(engine, "begin")
+    def _emit_begin(conn):
+        conn.exec_driver_sql("BEGIN")
+
+
+@pytest.fixture(scope="session")
+def enable_sqlite_savepoints():
+    """Returns the function that makes a pysqlite engine's SAVEPOINT-based test transactions roll back."""
+    return _enable_sqlite_savepoints
@@ -0,0 +1,206 @@
+import datetime
+import itertools
+import os
+import uuid
+
+import orjson
+import pytest
+from flask_jwt_extended import create_access_token
+from sqlalchemy import event
+from sqlalchemy.orm import scoped_session, sessionmaker
+from sqlalchemy.pool import StaticPool
+from werkzeug.security import generate_password_hash
+
+from backend.app import create_app, db
+from backend.app.models import User, Session
+
+
+# Hashed once at import; no test needs to verify this password.
+_PASSWORD_HASH = generate_password_hash("password")
+
+# Expiry of the test user's session row: fixed, so it never lapses during a run.
+_FAR_FUTURE = datetime.datetime(2099, 1, 1)
+
+
+# Use a specific configuration for testing
+class TestConfig:
+    TESTING = True
+    # Named shared-cache in-memory database; StaticPool keeps every checkout on one connection,
+    # so the schema created once per session is visible to every test and request.
+    # Each pytest-xdist worker (gw0, gw1, ...) gets a database of its own.
+    SQLALCHEMY_DATABASE_URI = (
+        f"sqlite+pysqlite:///file:testdb_{os.environ.get('PYTEST_XDIST_WORKER', 'gw0')}"
+        "?mode=memory&cache=shared&uri=true"
+    )
+    SQLALCHEMY_ENGINE_OPTIONS = {
+        "poolclass": StaticPool,
+        "connect_args": {"check_same_thread": False},
+    }
+    SECRET_KEY = 'test-secret-key'
+    JWT_SECRET_KEY = 'test-jwt-secret-key'
+    JWT_ACCESS_TOKEN_EXPIRES = datetime.timedelta(hours=1)
+    # Suppress CSRF protection in tests if you use Flask-WTF, etc.
+    # WTF_CSRF_ENABLED = False
+    GEMINI_API_KEY = "fake_gemini_key_for_testing_config_load" # So app doesn't fail if config expects it
+
+
+# Unique for the whole run; cheaper than a random uuid4 per address.
+_email_counter = itertools.count()
+
+
+def unique_email(prefix="testuser"):
+    return f"{prefix}_{next(_email_counter)}@example.com"
+
+
+class _StubUser:
+    """Lightweight stand-in for the ORM user; tests only need its id and email."""
+    __slots__ = ('id', 'email')
+
+    def __init__(self, id, email):
+        self.id = id
+        self.email = email
+
+
+# Every test authenticates as this user; its row, token and session row are created once.
+TEST_USER = _StubUser(id=uuid.UUID('3f1b6c2e-9d4a-4f8e-b7c5-1a2d3e4f5a6b'), email="testuser@example.com")
+
+
+@pytest.fixture(scope="session")
+def app():
+    # The app (blueprints, JWT manager, SQLAlchemy metadata) is built once per test session.
+    app = create_app(config_class=TestConfig)
+    with app.app_context():
+        yield app
+
+
+@pytest.fixture(scope="session")
+def _access_token(app):
+    return create_access_token(identity=str(TEST_USER.id))
+
+
+@pytest.fixture(scope="session")
+def _engine(app, _access_token, enable_sqlite_savepoints):
+    engine = db.engine
+    enable_sqlite_savepoints(engine)
+
+    # SQLite ignores foreign keys unless asked; enforce them like PostgreSQL does.
+    @event.listens_for(engine, "connect")
+    def _enable_foreign_keys(dbapi_connection, connection_record):
+        dbapi_connection.execute("PRAGMA foreign_keys=ON")
+
+    # The only DDL of the run: tables are created here and dropped in the finalizer below.
+    # Between tests the SAVEPOINT rollback in db_session empties them; nothing is dropped.
+    db.create_all()
+
+    # The test user and the session row for its token are committed once, outside the
+    # per-test transactions, so no test has to create them again.
+    with engine.begin() as connection:
+        connection.execute(User.__table__.insert().values(
+            id=TEST_USER.id, email=TEST_USER.email, password=_PASSWORD_HASH
+        ))
+        connection.execute(Session.__table__.insert().values(
+            user_id=TEST_USER.id,
+            token=_access_token,
+            expires_at=_FAR_FUTURE
+        ))
+
+    yield engine
+    db.drop_all()
+    # Release the pooled connection (and with it the in-memory database) once the run is over.
+    engine.dispose()
+
+
+@pytest.fixture
+def db_session(_engine):
+    """Runs each test inside a transaction that is rolled back on teardown.
+
+    Commits issued by the test or by the routes only release a SAVEPOINT, so the
+    schema never has to be dropped and recreated between tests. Fixture data should
+    be written inside ``db.session.begin_nested()``, which flushes on exit without
+    running the full commit machinery.
+    """
+    connection = _engine.connect()
+    transaction = connection.begin()
+    original_session = db.session
+    # expire_on_commit=False: fixture objects keep their loaded state after a commit,
+    # so reading e.g. ``bq_config.id`` afterwards does not issue a reload SELECT.
+    # autoflush=False: queries do not flush pending fixture state first; tests flush
+    # or commit explicitly before calling a route.
+    db.session = scoped_session(sessionmaker(
+        bind=connection,
+        join_transaction_mode="create_savepoint",
+        autoflush=False,
+        expire_on_commit=False,
+    ))
+
+    yield db.session
+
+    # Close the session explicitly so its identity map is dropped with the test, then
+    # discard the thread-local registry entry.
+    db.session.rollback()
+    db.session.expunge_all()
+    db.session.close()
+    db.session.remove()
+    db.session = original_session
+    transaction.rollback()
+    connection.close()
+
+
+@pytest.fixture(scope="session")
+def _test_client(app):
+    # One client for the run; the API is header-authenticated, so no cookies carry over.
+    return app.test_client()
+
+
+@pytest.fixture
+def client(_test_client, db_session):
+    # Depending on db_session guarantees every request runs inside the per-test transaction.
+    return _test_client
+
+
+@pytest.fixture
+def post_json(client, auth_headers):
+    """Authenticated JSON POST; the body is serialized with orjson rather than the client's json= encoder.
+
+    Pass ``headers`` (including the content type) to post as someone other than the test user.
+    """
+    headers = {**auth_headers, "Content-Type": "application/json"}
+
+    def _post_json(path, payload, headers=headers):
+        return client.post(path, data=orjson.dumps(payload), headers=headers)
+
+    return _post_json
+
+
+@pytest.fixture
+def user(_engine):
+    return TEST_USER
+
+
+@pytest.fixture
+def make_user(db_session):
+    """Factory for additional users, inserted with the precomputed password hash.
+
+    Goes through the users table directly so neither ``User.set_password`` nor the
+    ORM unit of work runs; the row is visible to the routes as soon as it returns.
+    """
+    insert_user = User.__table__.insert()
+
+    def _make_user(email_prefix="otheruser"):
+        new_user = _StubUser(id=uuid.uuid4(), email=unique_email(email_prefix))
+        db_session.execute(insert_user, {"id": new_user.id, "email": new_user.email, "password": _PASSWORD_HASH})
+        return new_user
+
+    return _make_user
+
+
+@pytest.fixture(scope="session")
+def auth_headers(_engine):
+    # TESTING-mode shortcut (see create_app): skips JWT verification and the session lookup.
+    return {"X-Test-User-Id": str(TEST_USER.id)}
+
+
+@pytest.fixture(scope="session")
+def jwt_auth_headers(_engine, _access_token):
+    # For the tests that exercise the real token_required_custom path.
+    return {"Authorization": f"Bearer {_access_token}"}
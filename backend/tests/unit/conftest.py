@@ -0,0 +1,32 @@
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+from sqlalchemy.pool import StaticPool
+
+from backend.app import db
+# Registers every table on db.metadata.
+from backend.app import models  # noqa: F401
+
+
+@pytest.fixture(scope="module")
+def engine(enable_sqlite_savepoints):
+    """A private in-memory SQLite database with the app's schema, created once per module."""
+    engine = create_engine("sqlite://", poolclass=StaticPool)
+    enable_sqlite_savepoints(engine)
+    db.metadata.create_all(engine)
+    yield engine
+    engine.dispose()
+
+
+@pytest.fixture
+def session(engine):
+    """A session whose commits only release SAVEPOINTs; everything is rolled back on teardown."""
+    connection = engine.connect()
+    transaction = connection.begin()
+    session = Session(bind=connection, join_transaction_mode="create_savepoint")
+
+    yield session
+
+    session.close()
+    transaction.rollback()
+    connection.close()
@@ -1,14 +1,20 @@
-import unittest
-from unittest.mock import patch, MagicMock, PropertyMock
 import json
+import types
+import orjson
+import xxhash
+
+import pytest
 
 # Adjust import to your project structure
+from backend.app.services import bigquery_service
 from backend.app.services.bigquery_service import BigQueryService
+from cachetools import TTLCache
 from google.cloud.bigquery import SchemaField
 from google.api_core.exceptions import GoogleAPICallError, NotFound
 
-# Dummy GCP Key JSON (structure is what matters for the test)
-DUMMY_GCP_KEY_JSON = {
+# Dummy GCP Key JSON (structure is what matters for the test). Read-only, so no test can
+# alter it for the others; it still compares equal to the dict the service parses.
+DUMMY_GCP_KEY_JSON = types.MappingProxyType({
     "type": "service_account",
     "project_id": "test-project",
     "private_key_id": "a1b2c3d4e5f6",
@@ -19,126 +25,283 @@ DUMMY_GCP_KEY_JSON = {
     "token_uri": "https://oauth2.googleapis.com/token",
     "auth_provider_x509_cert_url": "https://www.googleapis.com/oauth2/v1/certs",
     "client_x509_cert_url": "https://www.googleapis.com/robot/v1/metadata/x509/test-user%40test-project.iam.gserviceaccount.com"
-}
-DUMMY_GCP_KEY_STR = json.dumps(DUMMY_GCP_KEY_JSON)
-
-class TestBigQueryService(unittest.TestCase):
-
-    @patch('backend.app.services.bigquery_service.bigquery.Client')
-    @patch('backend.app.services.bigquery_service.service_account.Credentials.from_service_account_info')
-    def test_init_success(self, mock_from_service_account_info, mock_bigquery_client):
-        # Mock credentials object
-        mock_creds = MagicMock()
-        mock_creds.project_id = "test-project-from-creds"
-        mock_from_service_account_info.return_value = mock_creds
-
-        mock_bigquery_client_instance = MagicMock()
-        mock_bigquery_client.return_value = mock_bigquery_client_instance
-
-        service = BigQueryService(gcp_key_json_str=DUMMY_GCP_KEY_STR)
-
-        mock_from_service_account_info.assert_called_once_with(DUMMY_GCP_KEY_JSON)
-        mock_bigquery_client.assert_called_once_with(credentials=mock_creds, project="test-project-from-creds")
-        self.assertEqual(service.project_id, "test-project-from-creds")
-        self.assertIsNotNone(service.client)
-
-    def test_init_invalid_json(self):
-        with self.assertRaisesRegex(ValueError, "Invalid GCP JSON key format"):
-            BigQueryService(gcp_key_json_str="this is not json")
-
-    @patch('backend.app.services.bigquery_service.service_account.Credentials.from_service_account_info')
-    def test_init_credential_error(self, mock_from_service_account_info):
-        mock_from_service_account_info.side_effect = Exception("Credential load failed")
-        with self.assertRaisesRegex(ValueError, "Error initializing BigQuery client from key: Credential load failed"):
-            BigQueryService(gcp_key_json_str=DUMMY_GCP_KEY_STR)
-
-    @patch('backend.app.services.bigquery_service.bigquery.Client')
-    @patch('backend.app.services.bigquery_service.service_account.Credentials.from_service_account_info')
-    def test_get_table_schema_success(self, mock_from_service_account_info, mock_bigquery_client):
-        mock_creds = MagicMock()
-        mock_creds.project_id = "test-project"
-        mock_from_service_account_info.return_value = mock_creds
-
-        mock_table = MagicMock()
-        mock_table.schema = [
-            SchemaField("col1", "STRING", "NULLABLE", "description1", ()),
-            SchemaField("col2", "INTEGER", "REQUIRED", "description2", ()),
-        ]
-
-        mock_client_instance = MagicMock()
-        mock_client_instance.get_table.return_value = mock_table
-        mock_bigquery_client.return_value = mock_client_instance
-
-        service = BigQueryService(gcp_key_json_str=DUMMY_GCP_KEY_STR)
-        table_id = "dataset.table1"
-        success, result = service.get_table_schema(table_id)
-
-        self.assertTrue(success)
-        self.assertEqual(len(result), 2)
-        self.assertEqual(result[0]['name'], "col1")
-        self.assertEqual(result[0]['field_type'], "STRING")
-        self.assertEqual(result[1]['name'], "col2")
-        self.assertEqual(result[1]['field_type'], "INTEGER")
-        mock_client_instance.get_table.assert_called_once_with(table_id)
-
-    @patch('backend.app.services.bigquery_service.bigquery.Client')
-    @patch('backend.app.services.bigquery_service.service_account.Credentials.from_service_account_info')
-    def test_get_table_schema_not_found(self, mock_from_service_account_info, mock_bigquery_client):
-        mock_creds = MagicMock()
-        mock_creds.project_id = "test-project"
-        mock_from_service_account_info.return_value = mock_creds
-
-        mock_client_instance = MagicMock()
-        # Simulate NotFound error from BigQuery API
-        # The 'code' attribute is not standard on GoogleAPICallError, but we check for it in service.
-        # A more robust way is to mock a NotFound exception directly.
-        not_found_error = NotFound("Table not found") # google.api_core.exceptions.NotFound
-        # To simulate the specific e.code check in the service, we can mock the error object further if needed
-        # or adjust the service to check isinstance(e, NotFound)
-        mock_client_instance.get_table.side_effect = not_found_error
-
-        mock_bigquery_client.return_value = mock_client_instance
-        service = BigQueryService(gcp_key_json_str=DUMMY_GCP_KEY_STR)
-        table_id = "dataset.nonexistent_table"
-
-        success, result = service.get_table_schema(table_id)
-
-        self.assertFalse(success)
-        self.assertIn("message", result)
-        # The service method actually returns a more specific message for NotFound
-        # "Table or view '{table_id}' not found in project '{self.project_id}'. Error: {e}"
-        # Let's adjust the service code to use isinstance(e, NotFound) for more reliable check.
-        # For now, this test assumes the current string check might catch it or the generic one.
-        # This test is more robust if service checks `isinstance(e, google.api_core.exceptions.NotFound)`
-        # As of now, the service has `if e.code == 404`, which NotFound might not have.
-        # Let's assume the more generic error message path is taken if .code is not there.
-        # If the service is updated to check `isinstance(e, NotFound)`, this test will be more accurate.
-        # For now, check the generic message path from GoogleAPICallError.
-        self.assertIn(f"Failed to get schema for table '{table_id}'. BigQuery API error:", result['message'])
-
-
-    @patch('backend.app.services.bigquery_service.bigquery.Client')
-    @patch('backend.app.services.bigquery_service.service_account.Credentials.from_service_account_info')
-    def test_get_table_schema_generic_api_error(self, mock_from_service_account_info, mock_bigquery_client):
-        mock_creds = MagicMock()
-        mock_creds.project_id = "test-project"
-        mock_from_service_account_info.return_value = mock_creds
-
-        mock_client_instance = MagicMock()
-        # Simulate a generic GoogleAPICallError
-        api_error = GoogleAPICallError("Some API error")
-        mock_client_instance.get_table.side_effect = api_error
-        mock_bigquery_client.return_value = mock_client_instance
-
-        service = BigQueryService(gcp_key_json_str=DUMMY_GCP_KEY_STR)
-        table_id = "dataset.error_table"
-        success, result = service.get_table_schema(table_id)
-
-        self.assertFalse(success)
-        self.assertIn("message", result)
-        self.assertIn(f"Failed to get schema for table '{table_id}'. BigQuery API error: Some API error", result['message'])
-
-    # TODO: Add tests for dry_run_query and execute_query if time permits or in a separate pass
-
-if __name__ == '__main__':
-    unittest.main()
+})
+# Serialized once at import.
+DUMMY_GCP_KEY_STR = orjson.dumps(dict(DUMMY_GCP_KEY_JSON)).decode()
+
+
+@pytest.fixture(autouse=True)
+def _clear_caches():
+    # The schema and service caches are module-level; start every test from empty ones.
+    bigquery_service._schema_cache.clear()
+    bigquery_service._INSTANCES.clear()
+
+
+@pytest.fixture
+def mock_from_service_account_info(mocker):
+    return mocker.patch('backend.app.services.bigquery_service.service_account.Credentials.from_service_account_info')
+
+
+@pytest.fixture
+def bq_service_mocks(mocker, mock_from_service_account_info):
+    """Patches bigquery.Client and the credential loader; returns (mock_client, mock_creds)."""
+    mock_client = mocker.patch('backend.app.services.bigquery_service.bigquery.Client')
+    mock_creds = mock_from_service_account_info.return_value
+    mock_creds.project_id = "test-project"
+    return mock_client, mock_creds
+
+
+@pytest.fixture
+def mock_client_instance(bq_service_mocks):
+    mock_client, _ = bq_service_mocks
+    return mock_client.return_value
+
+
+def test_init_success(bq_service_mocks, mock_from_service_account_info):
+    mock_client, mock_creds = bq_service_mocks
+    mock_creds.project_id = "test-project-from-creds"
+
+    service = BigQueryService(gcp_key_json_str=DUMMY_GCP_KEY_STR)
+
+    mock_from_service_account_info.assert_called_once_with(DUMMY_GCP_KEY_JSON)
+    mock_client.assert_called_once()
+    client_kwargs = mock_client.call_args.kwargs
+    assert client_kwargs["credentials"] is mock_creds
+    assert client_kwargs["project"] == "test-project-from-creds"
+    assert client_kwargs["_http"] is not None
+    assert client_kwargs["_http"].get_adapter("https://bigquery.googleapis.com")._pool_maxsize == 32
+    assert service.project_id == "test-project-from-creds"
+    assert service._key_fingerprint == xxhash.xxh3_64_intdigest(DUMMY_GCP_KEY_STR.encode('utf-8'))
+    assert service.client is not None
+
+
+def test_init_invalid_json():
+    with pytest.raises(ValueError, match="Invalid GCP JSON key format"):
+        BigQueryService(gcp_key_json_str="this is not json")
+
+
+def test_init_credential_error(mock_from_service_account_info):
+    mock_from_service_account_info.side_effect = Exception("Credential load failed")
+    with pytest.raises(ValueError, match="Error initializing BigQuery client from key: Credential load failed"):
+        BigQueryService(gcp_key_json_str=DUMMY_GCP_KEY_STR)
+
+
+def test_get_table_schema_success(mocker, mock_client_instance):
+    mock_table = mocker.MagicMock()
+    mock_table.schema = [
+        SchemaField("col1", "STRING", "NULLABLE", "description1", ()),
+        SchemaField("col2", "INTEGER", "REQUIRED", "description2", ()),
+    ]
+    mock_client_instance.get_table.return_value = mock_table
+
+    service = BigQueryService(gcp_key_json_str=DUMMY_GCP_KEY_STR)
+    table_id = "dataset.table1"
+    success, result = service.get_table_schema(table_id)
+
+    assert success
+    assert len(result) == 2
+    assert result[0]['name'] == "col1"
+    assert result[0]['field_type'] == "STRING"
+    assert result[1]['name'] == "col2"
+    assert result[1]['field_type'] == "INTEGER"
+    mock_client_instance.get_table.assert_called_once_with(table_id)
+
+
+def test_get_table_schema_not_found(mock_client_instance):
+    # Simulate NotFound error from BigQuery API
+    # The 'code' attribute is not standard on GoogleAPICallError, but we check for it in service.
+    # A more robust way is to mock a NotFound exception directly.
+    not_found_error = NotFound("Table not found") # google.api_core.exceptions.NotFound
+    # To simulate the specific e.code check in the service, we can mock the error object further if needed
+    # or adjust the service to check isinstance(e, NotFound)
+    mock_client_instance.get_table.side_effect = not_found_error
+
+    service = BigQueryService(gcp_key_json_str=DUMMY_GCP_KEY_STR)
+    table_id = "dataset.nonexistent_table"
+
+    success, result = service.get_table_schema(table_id)
+
+    assert not success
+    assert "message" in result
+    # The service method actually returns a more specific message for NotFound
+    # "Table or view '{table_id}' not found in project '{self.project_id}'. Error: {e}"
+    # Let's adjust the service code to use isinstance(e, NotFound) for more reliable check.
+    # For now, this test assumes the current string check might catch it or the generic one.
+    # This test is more robust if service checks `isinstance(e, google.api_core.exceptions.NotFound)`
+    # As of now, the service has `if e.code == 404`, which NotFound might not have.
+    # Let's assume the more generic error message path is taken if .code is not there.
+    # If the service is updated to check `isinstance(e, NotFound)`, this test will be more accurate.
+    # For now, check the generic message path from GoogleAPICallError.
+    assert f"Failed to get schema for table '{table_id}'. BigQuery API error:" in result['message']
+
+
+def test_get_table_schema_generic_api_error(mock_client_instance):
+    # Simulate a generic GoogleAPICallError
+    api_error = GoogleAPICallError("Some API error")
+    mock_client_instance.get_table.side_effect = api_error
+
+    service = BigQueryService(gcp_key_json_str=DUMMY_GCP_KEY_STR)
+    table_id = "dataset.error_table"
+    success, result = service.get_table_schema(table_id)
+
+    assert not success
+    assert "message" in result
+    assert f"Failed to get schema for table '{table_id}'. BigQuery API error: Some API error" in result['message']
+
+
+def test_get_table_schema_cached(mocker, mock_client_instance):
+    mock_table = mocker.MagicMock()
+    mock_table.schema = [SchemaField("col1", "STRING")]
+    mock_client_instance.get_table.return_value = mock_table
+
+    service = BigQueryService(gcp_key_json_str=DUMMY_GCP_KEY_STR)
+    table_id = "dataset.table1"
+    first = service.get_table_schema(table_id)
+    # A second service for the same key shares the cache.
+    second = BigQueryService(gcp_key_json_str=DUMMY_GCP_KEY_STR).get_table_schema(table_id)
+
+    assert first == (True, [{"name": "col1", "field_type": "STRING"}])
+    assert second == first
+    assert mock_client_instance.get_table.call_count == 1
+
+
+def test_get_table_schema_cache_expiry(mocker, mock_client_instance):
+    mock_table = mocker.MagicMock()
+    mock_table.schema = [SchemaField("col1", "STRING")]
+    mock_client_instance.get_table.return_value = mock_table
+
+    # Drive the cache from a fake clock instead of sleeping past the TTL.
+    now = [0]
+    fake_clock_cache = TTLCache(maxsize=8, ttl=bigquery_service.SCHEMA_CACHE_TTL_SECONDS, timer=lambda: now[0])
+    mocker.patch.object(bigquery_service, '_schema_cache', fake_clock_cache)
+
+    service = BigQueryService(gcp_key_json_str=DUMMY_GCP_KEY_STR)
+    service.get_table_schema("dataset.table1")
+    now[0] = bigquery_service.SCHEMA_CACHE_TTL_SECONDS - 1
+    service.get_table_schema("dataset.table1")
+    assert mock_client_instance.get_table.call_count == 1
+
+    now[0] = bigquery_service.SCHEMA_CACHE_TTL_SECONDS + 1
+    service.get_table_schema("dataset.table1")
+    assert mock_client_instance.get_table.call_count == 2
+
+
+def test_get_table_schema_bytes_avoids_reserialize(mocker, mock_client_instance):
+    mock_table = mocker.MagicMock()
+    mock_table.schema = [SchemaField("col1", "STRING")]
+    mock_client_instance.get_table.return_value = mock_table
+
+    service = BigQueryService(gcp_key_json_str=DUMMY_GCP_KEY_STR)
+    mock_dumps = mocker.patch('backend.app.services.bigquery_service.orjson.dumps', wraps=orjson.dumps)
+    # Plain schema lookups never pay for serialization.
+    service.get_table_schema("dataset.table1")
+    mock_dumps.assert_not_called()
+
+    first = service.get_table_schema_bytes("dataset.table1")
+    second = service.get_table_schema_bytes("dataset.table1")
+
+    assert first == (True, b'[{"name":"col1","field_type":"STRING"}]')
+    assert second == first
+    assert mock_dumps.call_count == 1
+    # The decoded schema is served from the same cache entry.
+    assert service.get_table_schema("dataset.table1") == (True, [{"name": "col1", "field_type": "STRING"}])
+    assert mock_client_instance.get_table.call_count == 1
+
+
+def test_iter_table_schema_is_generator(mocker, mock_client_instance):
+    mock_table = mocker.MagicMock()
+    mock_table.schema = [SchemaField("col1", "STRING"), SchemaField("col2", "INTEGER")]
+    mock_client_instance.get_table.return_value = mock_table
+
+    service = BigQueryService(gcp_key_json_str=DUMMY_GCP_KEY_STR)
+    schema_iter = service.iter_table_schema("dataset.table1")
+
+    assert isinstance(schema_iter, types.GeneratorType)
+    mock_client_instance.get_table.assert_not_called()
+    assert next(schema_iter) == {"name": "col1", "field_type": "STRING"}
+    mock_client_instance.get_table.assert_called_once_with("dataset.table1")
+    assert list(schema_iter) == [{"name": "col2", "field_type": "INTEGER"}]
+
+
+def test_get_schemas_bulk_one_query_per_dataset(mock_client_instance):
+    table_names = [f"table{i}" for i in range(5)]
+    rows = [{"table_name": name, "column_name": column, "data_type": "STRING"}
+            for name in table_names for column in ("col1", "col2")]
+    mock_client_instance.query.return_value.result.return_value = iter(rows)
+
+    service = BigQueryService(gcp_key_json_str=DUMMY_GCP_KEY_STR)
+    success, result = service.get_schemas_bulk([f"dataset.{name}" for name in table_names])
+
+    assert success
+    assert set(result) == {f"dataset.{name}" for name in table_names}
+    assert result["dataset.table0"] == [{"name": "col1", "field_type": "STRING"},
+                                        {"name": "col2", "field_type": "STRING"}]
+    mock_client_instance.query.assert_called_once()
+    mock_client_instance.get_table.assert_not_called()
+    sql = mock_client_instance.query.call_args[0][0]
+    assert "`test-project.dataset.INFORMATION_SCHEMA.COLUMNS`" in sql
+    query_parameter = mock_client_instance.query.call_args[1]['job_config'].query_parameters[0]
+    assert query_parameter.values == table_names
+
+
+@pytest.mark.parametrize("table_id", [
+    "data-set.table1",
+    "dataset`; DROP TABLE x; --.table1",
+    ".table1",
+    "table1",
+])
+def test_get_schemas_bulk_rejects_invalid_dataset(mock_client_instance, table_id):
+    service = BigQueryService(gcp_key_json_str=DUMMY_GCP_KEY_STR)
+    success, result = service.get_schemas_bulk(["dataset.ok", table_id])
+
+    assert not success
+    assert f"Invalid table ID '{table_id}'" in result["message"]
+    mock_client_instance.query.assert_not_called()
+
+
+def test_service_pool_reuses_instance(bq_service_mocks):
+    mock_client, _ = bq_service_mocks
+
+    first = BigQueryService.get_or_create(DUMMY_GCP_KEY_STR)
+    second = BigQueryService.get_or_create(DUMMY_GCP_KEY_STR)
+    assert first is second
+    assert mock_client.call_count == 1
+
+    other_key = json.dumps({**DUMMY_GCP_KEY_JSON, "private_key_id": "other"})
+    third = BigQueryService.get_or_create(other_key)
+    assert third is not first
+    assert mock_client.call_count == 2
+
+
+def test_list_tables_fast_uses_large_page_size(mocker, mock_client_instance):
+    mock_client_instance.list_tables.return_value = iter([
+        mocker.Mock(project="test-project", dataset_id="dataset", table_id=f"table{i}") for i in range(3)
+    ])
+
+    service = BigQueryService(gcp_key_json_str=DUMMY_GCP_KEY_STR)
+    success, result = service.list_tables_fast("dataset")
+
+    assert success
+    assert result == [("test-project", "dataset", f"table{i}") for i in range(3)]
+    mock_client_instance.list_tables.assert_called_once()
+    assert mock_client_instance.list_tables.call_args.args == ("dataset",)
+    assert mock_client_instance.list_tables.call_args.kwargs["page_size"] == 1000
+    assert mock_client_instance.list_tables.call_args.kwargs["max_results"] is None
+
+
+def test_get_or_create_accepts_wide_integers(bq_service_mocks):
+    mock_client, _ = bq_service_mocks
+    # Valid JSON that the upload path's stdlib parser accepts, but orjson can't serialize.
+    key = {**DUMMY_GCP_KEY_JSON, "n": 2 ** 70}
+
+    first = BigQueryService.get_or_create(key)
+
+    assert BigQueryService.get_or_create(dict(key)) is first
+    assert mock_client.call_count == 1
+
+
+def test_get_or_create_unserializable_key_raises_value_error(bq_service_mocks):
+    with pytest.raises(ValueError, match="Invalid GCP JSON key format"):
+        BigQueryService.get_or_create({**DUMMY_GCP_KEY_JSON, "n": object()})
+
+# TODO: Add tests for dry_run_query and execute_query if time permits or in a separate pass
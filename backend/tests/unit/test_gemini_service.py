@@ -1,163 +1,215 @@
-import unittest
-from unittest.mock import patch, MagicMock, PropertyMock
-import os
+from types import SimpleNamespace
+
+import pytest
 
 # Adjust import to your project structure
+from backend.app.services import gemini_service
 from backend.app.services.gemini_service import GeminiService
-# Assuming google.generativeai types might be needed for mocking response
-import google.generativeai as genai
-from google.generativeai.types import generación_types # Using an alias to avoid conflict if any
-from google.generativeai.types import HarmCategory, HarmBlockThreshold, seguridad_types # Alias for safety types
-
-
-# Mock Part object for generate_content response
-class MockPart:
-    def __init__(self, text):
-        self.text = text
-
-# Mock Content object for generate_content response
-class MockContent:
-    def __init__(self, text):
-        self.parts = [MockPart(text)]
-
-# Mock Candidate object for generate_content response
-class MockCandidate:
-    def __init__(self, text, finish_reason="STOP"):
-        self.content = MockContent(text)
-        self.finish_reason = finish_reason
-        # Mocking safety_ratings if they are accessed, though not essential for basic text extraction
-        self.safety_ratings = [
-            seguridad_types.SafetyRating(category=HarmCategory.HARM_CATEGORY_DANGEROUS_CONTENT, probability=seguridad_types.HarmProbability.NEGLIGIBLE)
-        ]
-
-
-class TestGeminiService(unittest.TestCase):
-
-    DUMMY_API_KEY = "test_gemini_api_key"
-
-    @patch('backend.app.services.gemini_service.genai.configure')
-    @patch('backend.app.services.gemini_service.genai.GenerativeModel')
-    def test_init_success(self, mock_generative_model, mock_configure):
-        mock_model_instance = MagicMock()
-        mock_generative_model.return_value = mock_model_instance
-
-        service = GeminiService(api_key=self.DUMMY_API_KEY)
-
-        mock_configure.assert_called_once_with(api_key=self.DUMMY_API_KEY)
-        mock_generative_model.assert_called_once_with('gemini-1.5-flash-latest')
-        self.assertIsNotNone(service.model)
-
-    def test_init_no_api_key(self):
-        with self.assertRaisesRegex(ValueError, "GEMINI_API_KEY is required"):
-            GeminiService(api_key=None)
-        with self.assertRaisesRegex(ValueError, "GEMINI_API_KEY is required"):
-            GeminiService(api_key="")
-
-    @patch('backend.app.services.gemini_service.genai.configure')
-    def test_init_configure_fails(self, mock_configure):
-        mock_configure.side_effect = Exception("Configuration failed")
-        with self.assertRaisesRegex(ConnectionError, "Failed to configure Gemini API: Configuration failed"):
-            GeminiService(api_key=self.DUMMY_API_KEY)
-
-    @patch('backend.app.services.gemini_service.genai.GenerativeModel')
-    @patch('backend.app.services.gemini_service.genai.configure') # Keep configure mocked
-    def test_generate_sql_query_success(self, mock_configure, mock_generative_model_class):
-        mock_model_instance = MagicMock()
-        # Mock the response structure from Gemini API
-        mock_gemini_response = MagicMock(spec=generación_types.GenerateContentResponse) # Use the type for spec
-        mock_gemini_response.candidates = [MockCandidate("SELECT * FROM test_table;")]
-        # Mock prompt_feedback if accessed in case of empty/blocked response
-        mock_gemini_response.prompt_feedback = MagicMock(spec=seguridad_types.PromptFeedback)
-        mock_gemini_response.prompt_feedback.block_reason = None
-
-        mock_model_instance.generate_content.return_value = mock_gemini_response
-        mock_generative_model_class.return_value = mock_model_instance
-
-        service = GeminiService(api_key=self.DUMMY_API_KEY)
-        user_request = "show me all users"
-        objects_with_fields = [
-            {
-                'object_name': 'users.profiles',
-                'object_description': 'Table with user profile data.',
-                'fields': [
-                    {'field_name': 'id', 'field_description': 'User ID'},
-                    {'field_name': 'email', 'field_description': 'User email address'}
-                ]
-            }
-        ]
-
-        sql_query = service.generate_sql_query(user_request, objects_with_fields)
-
-        self.assertEqual(sql_query, "SELECT * FROM test_table;")
-        mock_model_instance.generate_content.assert_called_once()
-        # You can also assert the prompt construction if needed by inspecting call_args
-        # args, kwargs = mock_model_instance.generate_content.call_args
-        # self.assertIn("Table `users.profiles`", args[0])
-        # self.assertIn("User request: \"show me all users\"", args[0])
-
-    @patch('backend.app.services.gemini_service.genai.GenerativeModel')
-    @patch('backend.app.services.gemini_service.genai.configure')
-    def test_generate_sql_query_api_error(self, mock_configure, mock_generative_model_class):
-        mock_model_instance = MagicMock()
-        mock_model_instance.generate_content.side_effect = Exception("Gemini API error")
-        mock_generative_model_class.return_value = mock_model_instance
-
-        service = GeminiService(api_key=self.DUMMY_API_KEY)
-        sql_query = service.generate_sql_query("test request", [{'object_name': 't', 'fields': []}])
-
-        self.assertIsNone(sql_query) # Service handles error by returning None
-
-    @patch('backend.app.services.gemini_service.genai.GenerativeModel')
-    @patch('backend.app.services.gemini_service.genai.configure')
-    def test_generate_sql_query_empty_or_blocked_response(self, mock_configure, mock_generative_model_class):
-        mock_model_instance = MagicMock()
-
-        # Simulate empty candidates list
-        mock_gemini_response_empty = MagicMock(spec=generación_types.GenerateContentResponse)
-        mock_gemini_response_empty.candidates = []
-        mock_gemini_response_empty.prompt_feedback = MagicMock(spec=seguridad_types.PromptFeedback)
-        mock_gemini_response_empty.prompt_feedback.block_reason = seguridad_types.BlockReason.SAFETY
-
-        mock_model_instance.generate_content.return_value = mock_gemini_response_empty
-        mock_generative_model_class.return_value = mock_model_instance
-
-        service = GeminiService(api_key=self.DUMMY_API_KEY)
-        sql_query = service.generate_sql_query("test request", [{'object_name': 't', 'fields': []}])
-
-        self.assertIsNone(sql_query)
-
-    def test_generate_sql_query_input_validation(self):
-        service = GeminiService(api_key=self.DUMMY_API_KEY) # Assuming init works
-        self.assertIsNone(service.generate_sql_query("", [{'object_name': 't'}]))
-        self.assertIsNone(service.generate_sql_query("req", []))
-        self.assertIsNone(service.generate_sql_query("req", None))
-
-
-    @patch('backend.app.services.gemini_service.genai.GenerativeModel')
-    @patch('backend.app.services.gemini_service.genai.configure')
-    def test_generate_sql_query_markdown_cleanup(self, mock_configure, mock_generative_model_class):
-        mock_model_instance = MagicMock()
-
-        # Test various markdown formats
-        responses = [
-            ("```sql\nSELECT 1;\n```", "SELECT 1;"),
-            ("```\nSELECT 2;\n```", "SELECT 2;"),
-            ("SELECT 3;", "SELECT 3;"),
-            ("  ```sql\nSELECT 4;\n```  ", "SELECT 4;")
-        ]
-
-        for raw_response_text, expected_sql in responses:
-            mock_gemini_response = MagicMock(spec=generación_types.GenerateContentResponse)
-            mock_gemini_response.candidates = [MockCandidate(raw_response_text)]
-            mock_gemini_response.prompt_feedback = MagicMock(spec=seguridad_types.PromptFeedback)
-            mock_gemini_response.prompt_feedback.block_reason = None
-            mock_model_instance.generate_content.return_value = mock_gemini_response
-            mock_generative_model_class.return_value = mock_model_instance
-
-            service = GeminiService(api_key=self.DUMMY_API_KEY)
-            sql_query = service.generate_sql_query("test", [{'object_name': 't', 'fields': []}])
-            self.assertEqual(sql_query, expected_sql, f"Failed for raw response: {raw_response_text}")
-
-
-if __name__ == '__main__':
-    unittest.main()
+
+
+DUMMY_API_KEY = "test_gemini_api_key"
+SIMPLE_OBJECTS = [{'object_name': 't', 'fields': []}]
+
+
+@pytest.fixture(scope="module")
+def response_factory():
+    """Builds plain stand-ins for a generate_content response; the service only reads
+    candidates[0].content.parts[0].text, finish_reason and prompt_feedback.block_reason."""
+    def make_response(text=None, block_reason=None):
+        candidates = []
+        if text is not None:
+            part = SimpleNamespace(text=text)
+            candidates.append(SimpleNamespace(content=SimpleNamespace(parts=[part]), finish_reason="STOP"))
+        return SimpleNamespace(candidates=candidates, prompt_feedback=SimpleNamespace(block_reason=block_reason))
+    return make_response
+
+
+@pytest.fixture(autouse=True)
+def _clear_sql_cache():
+    # Generated SQL and prompt fragments are cached module-wide; start every test from empty caches.
+    gemini_service._sql_cache.clear()
+    gemini_service._schema_fragment.cache_clear()
+
+
+@pytest.fixture
+def mock_gemini_api_key(mocker):
+    mock_gemini_api_key = mocker.patch('backend.app.services.gemini_service.GeminiAPIKey')
+    mock_gemini_api_key.query.first.return_value = SimpleNamespace(api_key=DUMMY_API_KEY)
+    return mock_gemini_api_key
+
+
+@pytest.fixture
+def mock_configure(mocker):
+    return mocker.patch('backend.app.services.gemini_service.genai.configure')
+
+
+@pytest.fixture
+def mock_generative_model_class(mocker):
+    return mocker.patch('backend.app.services.gemini_service.genai.GenerativeModel')
+
+
+@pytest.fixture
+def mock_model(mock_generative_model_class):
+    return mock_generative_model_class.return_value
+
+
+@pytest.fixture
+def service(mock_gemini_api_key, mock_configure, mock_model):
+    return GeminiService()
+
+
+def test_init_success(mock_gemini_api_key, mock_configure, mock_generative_model_class):
+    service = GeminiService()
+
+    mock_configure.assert_called_once_with(api_key=DUMMY_API_KEY)
+    mock_generative_model_class.assert_called_once_with('gemini-1.5-flash-latest')
+    assert service.model is mock_generative_model_class.return_value
+
+
+@pytest.mark.parametrize("api_key_entry", [None, SimpleNamespace(api_key="")], ids=["no-entry", "empty-key"])
+def test_init_no_api_key(mock_gemini_api_key, api_key_entry):
+    mock_gemini_api_key.query.first.return_value = api_key_entry
+    with pytest.raises(ValueError, match="Gemini API Key not configured in the database"):
+        GeminiService()
+
+
+def test_init_configure_fails(mock_gemini_api_key, mock_configure):
+    mock_configure.side_effect = Exception("Configuration failed")
+    with pytest.raises(ConnectionError, match="Failed to configure Gemini API with key from database: Configuration failed"):
+        GeminiService()
+
+
+def test_generate_sql_query_success(service, mock_model, response_factory):
+    mock_model.generate_content.return_value = response_factory("SELECT * FROM test_table;")
+    user_request = "show me all users"
+    objects_with_fields = [
+        {
+            'object_name': 'users.profiles',
+            'object_description': 'Table with user profile data.',
+            'fields': [
+                {'field_name': 'id', 'field_description': 'User ID'},
+                {'field_name': 'email', 'field_description': 'User email address'}
+            ]
+        }
+    ]
+
+    result = service.generate_sql_query(user_request, objects_with_fields)
+
+    assert result['sql'] == "SELECT * FROM test_table;"
+    mock_model.generate_content.assert_called_once()
+    prompt = mock_model.generate_content.call_args[0][0]
+    assert prompt == result['full_prompt']
+    assert "Table `users.profiles`" in prompt
+    assert "User request: \"show me all users\"" in prompt
+
+
+def test_generate_sql_query_api_error(service, mock_model):
+    mock_model.generate_content.side_effect = Exception("Gemini API error")
+
+    result = service.generate_sql_query("test request", SIMPLE_OBJECTS)
+
+    assert result['sql'] is None # Service handles the error by returning no SQL
+
+
+def test_generate_sql_query_empty_or_blocked_response(service, mock_model, response_factory):
+    mock_model.generate_content.return_value = response_factory(block_reason="SAFETY")
+
+    result = service.generate_sql_query("test request", SIMPLE_OBJECTS)
+
+    assert result['sql'] is None
+
+
+def test_generate_sql_query_input_validation(service):
+    assert service.generate_sql_query("", [{'object_name': 't'}]) is None
+    assert service.generate_sql_query("req", []) is None
+    assert service.generate_sql_query("req", None) is None
+
+
+@pytest.mark.parametrize("user_request,objects_with_fields", [
+    ("", [{'object_name': 't'}]),
+    (None, [{'object_name': 't'}]),
+    ("req", []),
+    ("req", None),
+])
+def test_input_validation_short_circuits(mocker, service, mock_model, user_request, objects_with_fields):
+    mock_cache_key = mocker.patch('backend.app.services.gemini_service._cache_key')
+
+    assert service.generate_sql_query(user_request, objects_with_fields) is None
+
+    mock_cache_key.assert_not_called()
+    mock_model.generate_content.assert_not_called()
+
+
+@pytest.mark.parametrize("raw_response_text,expected_sql", [
+    ("```sql\nSELECT 1;\n```", "SELECT 1;"),
+    ("```\nSELECT 2;\n```", "SELECT 2;"),
+    ("SELECT 3;", "SELECT 3;"),
+    ("  ```sql\nSELECT 4;\n```  ", "SELECT 4;"),
+])
+def test_generate_sql_query_markdown_cleanup(service, mock_model, response_factory, raw_response_text, expected_sql):
+    mock_model.generate_content.return_value = response_factory(raw_response_text)
+
+    result = service.generate_sql_query("test", SIMPLE_OBJECTS)
+
+    assert result['sql'] == expected_sql
+
+
+def test_cleanup_no_fence_fast_path(mocker, service, mock_model, response_factory):
+    mock_model.generate_content.return_value = response_factory("SELECT 3;")
+    mock_fence_re = mocker.patch('backend.app.services.gemini_service._FENCE_RE')
+
+    result = service.generate_sql_query("test", SIMPLE_OBJECTS)
+
+    assert result['sql'] == "SELECT 3;"
+    mock_fence_re.sub.assert_not_called()
+
+
+def test_generate_sql_query_cache_hit(mock_gemini_api_key, mock_configure, mock_model, response_factory):
+    mock_model.generate_content.return_value = response_factory("SELECT 1;")
+
+    objects_with_fields = [
+        {'object_name': 'a.t1', 'fields': [{'field_name': 'x'}, {'field_name': 'y'}]},
+        {'object_name': 'a.t2', 'fields': []},
+    ]
+    first = GeminiService().generate_sql_query("count rows", objects_with_fields)
+    # Same request and context in a different order is still a hit, even from a new instance.
+    reordered = [
+        {'object_name': 'a.t2', 'fields': []},
+        {'object_name': 'a.t1', 'fields': [{'field_name': 'y'}, {'field_name': 'x'}]},
+    ]
+    second = GeminiService().generate_sql_query("count rows", reordered)
+
+    assert first['sql'] == "SELECT 1;"
+    assert second == first
+    assert mock_model.generate_content.call_count == 1
+
+    GeminiService().generate_sql_query("count other rows", objects_with_fields)
+    assert mock_model.generate_content.call_count == 2
+
+
+def test_prompt_schema_fragment_cached(service, mock_model, response_factory):
+    mock_model.generate_content.return_value = response_factory("SELECT 1;")
+    objects_with_fields = [{'object_name': 'a.t1', 'fields': [{'field_name': 'x', 'field_description': 'X'}]}]
+
+    first = service.generate_sql_query("count rows", objects_with_fields)
+    second = service.generate_sql_query("count other rows", objects_with_fields)
+
+    assert gemini_service._schema_fragment.cache_info().hits == 1
+    assert first['full_prompt'].replace("count rows", "count other rows") == second['full_prompt']
+    assert "- `x` (Description: X)" in second['full_prompt']
+
+
+def test_cache_key_total_order_with_mixed_descriptions(service, mock_model, response_factory):
+    mock_model.generate_content.return_value = response_factory("SELECT 1;")
+    # Same field name twice, one described and one not: plain tuple sorting would compare None with str.
+    objects_with_fields = [
+        {'object_name': 'a.t1', 'object_description': None,
+         'fields': [{'field_name': 'x', 'field_description': None}, {'field_name': 'x', 'field_description': 'X'}]},
+        {'object_name': 'a.t1', 'object_description': 'T1', 'fields': None},
+    ]
+
+    result = service.generate_sql_query("count rows", objects_with_fields)
+
+    assert result['sql'] == "SELECT 1;"
+    assert gemini_service._cache_key("count rows", objects_with_fields) == \
+        gemini_service._cache_key("count rows", list(reversed(objects_with_fields)))